@@ -1,2 +1,13 @@
-from .source_code import SourceCode
-from .impacker import Impacker
\ No newline at end of file
+__all__ = ['SourceCode', 'Impacker']
+
+def __getattr__(name: str):
+    # `ast` is only loaded once the packer itself is needed (not for `--help`, etc...).
+    match name:
+        case 'SourceCode':
+            from .source_code import SourceCode as value
+        case 'Impacker':
+            from .impacker import Impacker as value
+        case _:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
\ No newline at end of file
@@ -1,11 +1,10 @@
 import argparse
 from pathlib import Path
 
-from . import SourceCode, Impacker
-
 parser = argparse.ArgumentParser(prog="impacker", description="Merge a Python code and its dependencies into a single file.")
 
 parser.add_argument('-v', '--verbose', help="prints verbose log", action='store_true')
+parser.add_argument('-j', '--jobs', help="number of workers used to parse source codes", type=int, default=1)
 parser.add_argument('--no-shake-tree', dest='shake_tree', help="do not shake import tree", action='store_const', const=False, default=True)
 
 parser.add_argument('-s', '--strip', help="strip all comments and docstrings", action='store_true')
@@ -20,12 +19,17 @@ args = parser.parse_args()
 in_file = args.in_file
 out_file = args.out_file
 
+if not in_file.is_file():
+    parser.error(f"no such file: {str(in_file)!r}")
+
+from . import SourceCode, Impacker
+
 delattr(args, 'in_file')
 delattr(args, 'out_file')
 
 impacker = Impacker(**vars(args))
 in_code = SourceCode.from_path(in_file)
 
-out_code = impacker.pack(in_code)
-with open(out_file, 'w', encoding='utf-8') as f:
-    f.write(out_code)
\ No newline at end of file
+out_parts = impacker.pack_parts(in_code)
+with out_file.open('w', encoding='utf-8') as f:
+    f.writelines(out_parts)
\ No newline at end of file
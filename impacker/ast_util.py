@@ -0,0 +1,7 @@
+import ast
+
+DEF_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+""" Types of definitions (which may have docstrings). """
+
+BLOCK_FIELDS = ('body', 'orelse', 'finalbody', 'handlers', 'cases')
+""" Fields of AST nodes containing statements (or except handlers, match cases). """
\ No newline at end of file
@@ -1,13 +1,37 @@
 import ast
+import copy
 
-class DocstringRemover(ast.NodeTransformer):
-    __slots__ = tuple()
+from .ast_util import BLOCK_FIELDS, DEF_TYPES
 
-    def __init__(self):
-        super().__init__()
+def is_docstring(stmt: ast.stmt) -> bool:
+    return type(stmt) is ast.Expr and type(stmt.value) is ast.Constant and type(stmt.value.value) is str
 
-    def visit_Expr(self, node: ast.Expr):
-        match node.value:
-            case ast.Constant(value, kind):
-                return None
-        return self.generic_visit(node)
\ No newline at end of file
+def strip_docstrings(stmts: list[ast.stmt]) -> list[ast.stmt]:
+    """
+        Returns module-level statements `stmts` without docstrings, including those of all definitions nested in them.
+        Given statements are not modified; ones containing docstrings are replaced by (shallow) copies.
+        Only statement bodies are traversed; expressions are never visited.
+
+        Module-level string expressions have no effect, so all of them (not only the first one) are removed.
+    """
+    return [_strip_stmt(stmt) for stmt in stmts if not is_docstring(stmt)]
+
+def _strip_body(body: list[ast.stmt]) -> list[ast.stmt]:
+    """ Returns `body` itself when nothing in it has a docstring. """
+    stripped = [_strip_stmt(stmt) for stmt in body]
+    return body if all(new is old for (new, old) in zip(stripped, body)) else stripped
+
+def _strip_stmt(stmt: ast.stmt|ast.excepthandler|ast.match_case) -> ast.stmt|ast.excepthandler|ast.match_case:
+    changes = dict()
+    for field in BLOCK_FIELDS:
+        if body := getattr(stmt, field, None):
+            if field == 'body' and isinstance(stmt, DEF_TYPES) and is_docstring(body[0]):
+                changes[field] = _strip_body(body[1:]) or [ast.Pass()]
+            elif (stripped := _strip_body(body)) is not body:
+                changes[field] = stripped
+
+    if not changes: return stmt
+
+    stmt = copy.copy(stmt)
+    for (field, value) in changes.items(): setattr(stmt, field, value)
+    return stmt
\ No newline at end of file
@@ -1,28 +1,84 @@
 import ast
-from dataclasses import dataclass
-from pathlib import Path
+import copy
+import itertools
+import os
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
 from importlib.machinery import ModuleSpec
 
-from .docstring_remover import DocstringRemover
+from .ast_util import DEF_TYPES
+from .docstring_remover import is_docstring, strip_docstrings
 from .import_group import ImportGroup, ImportModule, ImportStarFromModule, ImportFromModule
 from . import import_resolve
 from .source_code import SourceCode
 
+PROCESS_POOL_MIN_BYTES = 256 * 1024
+""" Source codes smaller than this (in total, per level of the import graph) are parsed in threads, as processes would cost more to start and to pickle ASTs back. """
+
+def unparse_stmts(stmts: list[ast.stmt], cache: dict[int, str]|None = None) -> str:
+    """
+        Same as `ast.unparse(ast.Module(stmts, []))`, but each statement is unparsed separately.
+        When `cache` (id(stmt) |-> code) is given, a statement is unparsed at most once; statements must outlive `cache`.
+    """
+    lines = list[str]()
+    for i, stmt in enumerate(stmts):
+        if cache is None or (code := cache.get(id(stmt))) is None:
+            # A leading string is formatted as a docstring, like `ast.unparse` does for modules.
+            code = ast.unparse(ast.Module([stmt], []) if i == 0 and is_docstring(stmt) else stmt)
+            if cache is not None: cache[id(stmt)] = code
+
+        # Definitions are separated from preceding statements by a blank line, again like modules.
+        if i and isinstance(stmt, DEF_TYPES): lines.append("")
+        lines.append(code)
+    return "\n".join(lines)
+
 @dataclass(frozen=True, slots=True)
 class CodeChunk:
     comment: str
     chunk: list[ast.stmt]
 
+    source: SourceCode|None = None
+    """ When given, statements in `chunk` are from `source.root_ast`, and `source.unparse_cache` is used for them. """
+
+    _cached_code: dict[bool, str] = field(init=False, repr=False, compare=False)
+    """ comment |-> result of `to_code(comment)` """
+
+    def __post_init__(self):
+        object.__setattr__(self, '_cached_code', dict())
+
     def to_code(self, comment=True) -> str:
-        code = "\n".join(map(ast.unparse, self.chunk))
+        comment = bool(comment)
+        if (code := self._cached_code.get(comment)) is not None:
+            return code
+
+        if self.source is not None:
+            code = unparse_stmts(self.chunk, self.source.unparse_cache)
+        elif len(self.chunk) == 1:
+            code = ast.unparse(self.chunk[0])
+        else:
+            code = unparse_stmts(self.chunk)
+
         if comment and self.comment:
-            code = "\n".join(f"# {line}" for line in self.comment.split("\n")) + "\n" + code
+            if "\n" in self.comment:
+                code = "\n".join(f"# {line}" for line in self.comment.split("\n")) + "\n" + code
+            else:
+                code = f"# {self.comment}\n{code}"
+
+        self._cached_code[comment] = code
         return code
     
-    def apply_transform(self, transformer: ast.NodeTransformer|None):
-        if not transformer: return
-        for i, stmt in enumerate(self.chunk):
-            self.chunk[i] = transformer.visit(stmt)
+    def apply_transform(self, transform: Callable[[list[ast.stmt]], list[ast.stmt]]|None):
+        """ Replaces statements of this chunk with the result of `transform`, which must not modify the statements given to it. """
+        if not transform: return
+        prev_ids = {id(stmt) for stmt in self.chunk}
+        self.chunk[:] = transform(self.chunk)
+        self._cached_code.clear()
+
+        # New statements are not from `source.root_ast`, so they can't be cached by their ids there.
+        if self.source is not None and any(id(stmt) not in prev_ids for stmt in self.chunk):
+            object.__setattr__(self, 'source', None)
 
     def __str__(self) -> str:
         return self.to_code()
@@ -30,26 +86,27 @@ class CodeChunk:
 class Impacker:
     """ Packs a code and its dependencies into a single file. """
 
+    __slots__ = ('verbose', 'jobs', 'shake_tree', 'include_source_location', 'strip_docstring', '_source_code_cache', '_resolver')
+
     verbose: bool
 
+    jobs: int
+    """ Number of workers used to parse imported source codes; values less than 2 parse them serially. """
+
     shake_tree: bool
 
     include_source_location: bool
     strip_docstring: bool
 
-    _source_code_cache: dict[Path, SourceCode]
-
-    _source_code_import_cache: dict[int, dict[str, SourceCode|None]]
-    """ id(code) |-> module |-> get_source_code(code.find_spec(module))"""
-    
-    _source_code_requires: dict[int, set[str]]
-    """ id(code) |-> set of variables that should be include (because they are referenced by main code) """
+    _source_code_cache: dict[str, SourceCode]
+    """ spec.origin |-> source code of the current pack; codes hold the state of the pack (`_requires`, ...), so each pack starts afresh. """
 
-    _source_code_externals: dict[int, set[str]]
-    """ id(code) |-> set of variables that should be imported for this code """
+    _resolver: import_resolve.ImportResolver
+    """ Resolves imports of the current pack; a new one is used for each pack, as files may change in between. """
 
-    def __init__(self, *, verbose=False, shake_tree=True, strip=False, include_source_location=True, strip_docstring=False):
+    def __init__(self, *, verbose=False, shake_tree=True, strip=False, include_source_location=True, strip_docstring=False, jobs=1):
         self.verbose = verbose
+        self.jobs = jobs
 
         self.shake_tree = shake_tree
 
@@ -57,16 +114,26 @@ class Impacker:
         self.include_source_location = include_source_location and not strip
 
         self._source_code_cache = dict()
-        self._source_code_import_cache = dict()
-        self._source_code_requires = dict()
-        self._source_code_externals = dict()
+        self._resolver = import_resolve.ImportResolver()
 
     def pack(self, in_code: SourceCode) -> str:
+        return "".join(self.pack_parts(in_code))
+
+    def pack_parts(self, in_code: SourceCode) -> list[str]:
+        """ Same as `pack`, but returns pieces of the packed code, to be concatenated or written as-is. """
         self.log(f"Packing {in_code}...")
-        self.log(f"- Using sys.path = {repr(import_resolve.sys_path)}")
+        if self.verbose: self.log(f"- Using sys.path = {repr(import_resolve.sys_path)}")
+
+        self._resolver = import_resolve.ImportResolver()
+        self._source_code_cache = dict()
+
+        # `in_code` may be shared (see `SourceCode.from_path`), so the state of this pack is kept on a copy of it.
+        in_code = copy.copy(in_code.read())
 
         self._put_source_code(in_code)
-        self._source_code_externals[id(in_code)] = in_code.unresolved_globals.copy()
+        if self.jobs > 1:
+            self._preload_imports(in_code)
+        in_code._externals = in_code.unresolved_globals.copy()
 
         if self.shake_tree:
             self.log("Marking which definitions should be exported...")
@@ -74,126 +141,112 @@ class Impacker:
    
         self.log("Packing source codes...")
 
-        chunks, import_group = self._pack_from(in_code, set())
-        import_header = ""
-        if import_group:
-            import_header = "\n".join(map(ast.unparse, import_group.to_asts()))
-        
+        chunks, import_group = self._pack_from(in_code)
         if self.strip_docstring:
-            docstring_remover = DocstringRemover()
-            for chunk in chunks: chunk.apply_transform(docstring_remover)
+            for chunk in chunks: chunk.apply_transform(strip_docstrings)
 
-        import_body = "\n\n".join(chunk.to_code(self.include_source_location) for chunk in chunks)
+        parts: list[str] = []
+        if import_group:
+            parts.append(import_group.to_source())
+            parts.append("\n\n")
 
-        if import_header:
-            return f"{import_header}\n\n{import_body}"
-        else:
-            return import_body
+        for i, chunk in enumerate(chunks):
+            if i: parts.append("\n\n")
+            parts.append(chunk.to_code(self.include_source_location))
+
+        return parts
 
     def clear(self):
         self._source_code_cache.clear()
-        self._source_code_import_cache.clear()
-        self._source_code_requires.clear()
-        self._source_code_externals.clear()
-
-    def _pack_from(self, code: SourceCode, visited: set[int]) -> tuple[list[CodeChunk], ImportGroup]:
-        self.log(f"- Packing {code}...")
-        is_root = (len(visited) == 0)
-        code_id = id(code)
-
-        code_name = "main code" if is_root else code.name
+        self._resolver = import_resolve.ImportResolver()
 
-        visited.add(code_id)
-        
+    def _pack_from(self, root: SourceCode) -> tuple[list[CodeChunk], ImportGroup]:
+        """
+            Packs `root` and every source code it (transitively) imports.
+            Imported codes are visited depth-first with an explicit stack, and each code's chunks are emitted after those of its imports.
+        """
         chunks: list[CodeChunk] = list()
+        import_group = ImportGroup()
 
-        externals = None
-        need_externals = False
+        visited = {id(root)}
+        stack = [self._visit_pack_from(root)]
 
-        if self.shake_tree:
-            externals = self._source_code_externals.get(code_id)
-            need_externals = True
+        while stack:
+            code, imports, externals = stack[-1]
+            need_externals = self.shake_tree
 
-        import_group = ImportGroup()
-        for imp in code.imports.ordered_imports:
-            match imp:
-                case ImportModule(_, alias):
+            for imp in imports:
+                if type(imp) is ImportModule:
                     # Do not import when `alias` is not marked as something that's required.
-                    if (not need_externals) or (externals and (alias in externals)):
+                    if (not need_externals) or (externals and (imp.alias in externals)):
                         import_group.add(imp)
-                case _:
-                    if imp_code := self.get_import(code, imp.module):
-                        if id(imp_code) not in visited:
-                            module_chunks, module_import_group = self._pack_from(imp_code, visited)
-
-                            chunks.extend(module_chunks)
-                            import_group.extend(module_import_group)
-                    else:
-                        # TODO: do not include unused `import module` or `from module import *` statements.
-                        if (not need_externals) or externals:
-                            import_group.add(imp)
+                elif imp_code := self.get_import(code, imp.module):
+                    if id(imp_code) not in visited:
+                        visited.add(id(imp_code))
+                        stack.append(self._visit_pack_from(imp_code))
+                        break
+                else:
+                    # TODO: do not include unused `import module` or `from module import *` statements.
+                    if (not need_externals) or externals:
+                        import_group.add(imp)
+            else:
+                stack.pop()
+                chunks.extend(self._pack_chunks(code, code is root))
+
+        return (chunks, import_group)
+
+    def _visit_pack_from(self, code: SourceCode) -> tuple[SourceCode, Iterator[ImportModule|ImportStarFromModule|ImportFromModule], set[str]|None]:
+        if self.verbose: self.log(f"- Packing {code}...")
+        return (code, iter(code.imports.ordered_imports), code._externals if self.shake_tree else None)
+
+    def _pack_chunks(self, code: SourceCode, is_root: bool) -> list[CodeChunk]:
+        """ Returns chunks containing definitions from `code` itself (excluding its imports). """
+        code_name = "main code" if is_root else code.name
+        chunks: list[CodeChunk] = list()
 
         if is_root or not self.shake_tree:
             # Pack everything from this source code.
             stmts: list[ast.stmt] = []
             for stmt in code.root_ast.body:
-                match stmt:
-                    case ast.Import(_):
-                        pass
-                    case ast.ImportFrom(_, names):
-                        for alias in names:
-                            if alias.asname:
-                                stmts.append(ast.Assign([ast.Name(alias.asname, ast.Store())], ast.Name(alias.name, ast.Load())))
-                    case _:
-                        stmts.append(stmt)
+                stmt_type = type(stmt)
+                if stmt_type is ast.Import:
+                    pass
+                elif stmt_type is ast.ImportFrom:
+                    # Statements from `root_ast` already have locations; synthesized ones take the import's.
+                    loc = dict(lineno=stmt.lineno, col_offset=stmt.col_offset, end_lineno=stmt.end_lineno, end_col_offset=stmt.end_col_offset)
+                    for alias in stmt.names:
+                        if alias.asname:
+                            stmts.append(ast.Assign([ast.Name(alias.asname, ast.Store(), **loc)], ast.Name(alias.name, ast.Load(), **loc), **loc))
+                else:
+                    stmts.append(stmt)
             if stmts:
-                chunks.append(CodeChunk(f"From {code_name}", [ast.fix_missing_locations(stmt) for stmt in stmts]))
-        elif requires := self._source_code_requires.get(code_id):
+                chunks.append(CodeChunk(f"From {code_name}", stmts))
+        elif requires := code._requires:
             # Pack only what's required, in the order they appear in original source code.
-            req_defs = []
-            for req in requires:
-                req_def = code.global_defines[req]
-                req_defs.append(((req_def.lineno, req_def.col_offset), req_def))
+            global_defines = code.global_defines
+            req_defs = (global_defines[req] for req in sorted(requires, key=code.global_define_index.__getitem__))
             
-            chunks.extend(CodeChunk(f"{req_def.name} | from {code_name}, line {req_def.lineno}", [req_def]) for (_, req_def) in sorted(req_defs))
+            chunks.extend(CodeChunk(f"{req_def.name} | from {code_name}, line {req_def.lineno}", [req_def], code) for req_def in req_defs)
 
-        return (chunks, import_group)
+        return chunks
 
     def _mark_source_code_requires(self, code: SourceCode, requires: set[str]):
         """ Given that `requires` is needed from `code`, mark all definitions from `code` that's needed. """
         if not requires: return
 
-        self.log(f"- Inspecting {code} for {repr(requires)}...")
-
-        code_id = id(code)
-        req_set = self._source_code_requires[code_id]
-        if req_set is None:
-            req_set = set[str]()
-            self._source_code_requires[code_id] = req_set
+        if self.verbose: self.log(f"- Inspecting {code} for {repr(requires)}...")
 
-        externals = set()
+        defines = code.global_define_names
+        transitive_deps = code.transitive_deps
 
-        while requires:
-            next_requires = set()
-
-            for req in requires:
-                if req in req_set:
-                    continue
-                if req in externals:
-                    continue
-                if req in code.global_defines:
-                    req_set.add(req)
-                    if next_reqs := code.dependency.get(req):
-                        next_requires.update(next_reqs)
-                else:
-                    externals.add(req)
-            
-            requires = next_requires
+        closure = set(requires).union(*(transitive_deps[req] for req in requires if req in defines))
+        code._requires |= closure & defines
+        externals = closure - defines
         
-        prev_externals = self._source_code_externals.get(code_id)
+        prev_externals = code._externals
         if prev_externals is None:
             prev_externals = set()
-            self._source_code_externals[code_id] = prev_externals
+            code._externals = prev_externals
         
         externals -= prev_externals
         prev_externals |= externals
@@ -202,19 +255,57 @@ class Impacker:
     
     def _gather_source_code_requires_from_imports(self, code: SourceCode, requires: set[str]):
         """ Given that `requires` is needed, lookup imports to mark required definitions. """
-        for imp in reversed(code.imports.ordered_imports):
-            if not requires: return
-            match imp:
-                case ImportModule(_, alias):
-                    pass
-                case ImportStarFromModule(module):
-                    if imp_code := self.get_import(code, module):
-                        self._mark_source_code_requires(imp_code, requires)
-                case ImportFromModule(module, name, alias):
-                    if imp_code := self.get_import(code, module):
-                        if alias in requires:
-                            requires.remove(alias)
-                            self._mark_source_code_requires(imp_code, {name})
+        if not requires: return
+
+        # imported code |-> names to mark; each code is marked once for all of its names.
+        marks = dict[SourceCode, set[str]]()
+
+        # Names imported explicitly; the last import that resolves to a source code wins.
+        taken = list[tuple[int, str]]()
+        for alias in requires:
+            for (i, imp) in code.import_by_alias.get(alias, ()):
+                if imp_code := self.get_import(code, imp.module):
+                    taken.append((i, alias))
+                    marks.setdefault(imp_code, set()).add(imp.name)
+                    break
+
+        # A star import provides every name not taken by an explicit import after it.
+        for (i, imp) in code.star_imports:
+            star_requires = requires.difference(alias for (j, alias) in taken if j > i)
+            if star_requires and (imp_code := self.get_import(code, imp.module)):
+                marks.setdefault(imp_code, set()).update(star_requires)
+
+        for (imp_code, names) in marks.items():
+            self._mark_source_code_requires(imp_code, names)
+
+    def _preload_imports(self, root: SourceCode):
+        """ Parses every source code reachable from `root` in parallel, one level of the import graph at a time. """
+        self.log(f"Parsing imported source codes with {self.jobs} workers...")
+
+        seen = {root.spec.origin}
+        frontier = [root]
+
+        with ExitStack() as stack:
+            threads = stack.enter_context(ThreadPoolExecutor(self.jobs))
+            processes: ProcessPoolExecutor|None = None
+
+            while frontier:
+                specs: list[ModuleSpec] = []
+                for code in frontier:
+                    for imp in code.imports.ordered_imports:
+                        if type(imp) is ImportModule: continue
+                        spec = self.find_spec_from(code.spec, imp.module)
+                        if spec is None or spec.origin in seen: continue
+                        seen.add(spec.origin)
+                        if not self.has_source_code(spec): specs.append(spec)
+
+                executor: Executor = threads
+                if len(specs) > 1 and sum(os.path.getsize(spec.origin) for spec in specs) >= PROCESS_POOL_MIN_BYTES:
+                    if processes is None: processes = stack.enter_context(ProcessPoolExecutor(self.jobs))
+                    executor = processes
+
+                frontier = list(executor.map(_read_source_code, specs, itertools.repeat(not self.shake_tree)))
+                for code in frontier: self._put_source_code(code)
 
     def get_source_code(self, spec: ModuleSpec) -> SourceCode:
         code_path = spec.origin
@@ -223,6 +314,10 @@ class Impacker:
             return code
 
         code = SourceCode(spec)
+        if not self.shake_tree:
+            # Whole codes are packed, so only their imports are needed.
+            code.read_imports()
+
         self._put_source_code(code)
         return code
 
@@ -231,15 +326,12 @@ class Impacker:
 
     def _put_source_code(self, code: SourceCode):
         self._source_code_cache[code.spec.origin] = code
-        self._source_code_requires[id(code)] = set()
+        code._requires = set()
+        code._externals = None
+        code._import_cache = dict()
 
     def get_import(self, code: SourceCode, module: str) -> SourceCode|None:
-        code_id = id(code)
-        import_map = self._source_code_import_cache.get(code_id)
-        if import_map is None:
-            import_map = dict[str, SourceCode|None]()
-            self._source_code_import_cache[code_id] = import_map
-        
+        import_map = code._import_cache
         if module in import_map:
             return import_map[module]
         
@@ -250,7 +342,12 @@ class Impacker:
         return ret
 
     def find_spec_from(self, spec: ModuleSpec, module: str) -> ModuleSpec|None:
-        return import_resolve.find_spec_from(module, spec)
+        return self._resolver.find_spec_from(module, spec)
 
     def log(self, *args):
-        if self.verbose: print(*args)
\ No newline at end of file
+        if self.verbose: print(*args)
+
+def _read_source_code(spec: ModuleSpec, imports_only: bool) -> SourceCode:
+    """ Used by workers of `Impacker._preload_imports`, so that codes are also read there. """
+    code = SourceCode(spec)
+    return code.read_imports() if imports_only else code.read()
\ No newline at end of file
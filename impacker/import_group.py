@@ -1,4 +1,5 @@
 import ast
+import sys
 from dataclasses import dataclass
 
 from .import_resolve import split_module_name
@@ -31,64 +32,129 @@ class ImportFromModule():
 
 class ImportGroup():
     __slots__ = ('ordered_imports',)
-    ordered_imports: list[ImportModule|ImportStarFromModule|ImportFromModule]
+    ordered_imports: dict[ImportModule|ImportStarFromModule|ImportFromModule, None]
+    """ Imports in order, without duplicates; a repeated import moves to its latest position. """
     
-    def __init__(self): self.ordered_imports = []
+    def __init__(self): self.ordered_imports = dict()
 
     def __bool__(self): return len(self.ordered_imports) > 0
     def __len__(self): return len(self.ordered_imports)
     def __iter__(self): yield from self.ordered_imports
     
     def add(self, node: ast.Import|ast.ImportFrom|ImportModule|ImportStarFromModule|ImportFromModule):
-        match node:
-            case ast.Import(names):
-                for alias in names:
-                    self.ordered_imports.append(ImportModule(alias.name, alias.asname or alias.name))
-            case ast.ImportFrom(module, names, level):
-                module_name = (level * ".") + (module or "")
-                for alias in names:
-                    if alias.name == '*':
-                        self.ordered_imports.append(ImportStarFromModule(module_name))
-                    else:
-                        self.ordered_imports.append(ImportFromModule(module_name, alias.name, alias.asname or alias.name))
-            case _:
-                self.ordered_imports.append(node)
+        # Identifiers from the parser are already interned, but dotted module names are built by joining them.
+        # (Imported names are interned as well, as they may come from unpickled ASTs.)
+        node_type = type(node)
+        if node_type is ast.Import:
+            for alias in node.names:
+                module_name = sys.intern(alias.name)
+                self._add(ImportModule(module_name, alias.asname or module_name))
+        elif node_type is ast.ImportFrom:
+            module_name = sys.intern((node.level * ".") + (node.module or ""))
+            for alias in node.names:
+                if alias.name == '*':
+                    self._add(ImportStarFromModule(module_name))
+                else:
+                    name = sys.intern(alias.name)
+                    self._add(ImportFromModule(module_name, name, sys.intern(alias.asname) if alias.asname else name))
+        else:
+            self._add(node)
+
+    def _add(self, imp: ImportModule|ImportStarFromModule|ImportFromModule):
+        # The last import of a name wins, so a repeated import is only kept at its latest position.
+        ordered_imports = self.ordered_imports
+        ordered_imports.pop(imp, None)
+        ordered_imports[imp] = None
 
     def extend(self, other):
-        self.ordered_imports.extend(other.ordered_imports)
+        for imp in other.ordered_imports: self._add(imp)
         return self
 
+    def _bound_imports(self) -> list[ImportModule|ImportStarFromModule|ImportFromModule]:
+        """ Returns `ordered_imports` without imports whose name is bound again by a later import.
+            Imports are grouped by module once formatted, which would otherwise change which one binds the name last. """
+        bound = set[str]()
+        imps = list[ImportModule|ImportStarFromModule|ImportFromModule]()
+        for imp in reversed(self.ordered_imports):
+            t = type(imp)
+            if t is ImportFromModule or (t is ImportModule and imp.alias != imp.module):
+                if imp.alias in bound: continue
+                bound.add(imp.alias)
+            elif t is ImportModule:
+                # `import a.b` and `import a.c` both bind `a`, but each one is needed for its submodule.
+                name = imp.module.partition('.')[0]
+                if name == imp.module and name in bound: continue
+                bound.add(name)
+            imps.append(imp)
+        imps.reverse()
+        return imps
+
+    def to_source(self) -> str:
+        """ Formats the imports directly as source code, grouped the same way as `to_asts`. """
+        imports = dict[str, None]()
+        import_stars = dict[str, None]()
+        import_froms = dict[str, dict[str, str]]()
+
+        for imp in self._bound_imports():
+            t = type(imp)
+            if t is ImportModule:
+                imports[imp.module if imp.alias == imp.module else f"{imp.module} as {imp.alias}"] = None
+            elif t is ImportStarFromModule:
+                import_stars[imp.module] = None
+            else:
+                names = import_froms.get(imp.module)
+                if names is None:
+                    names = import_froms[imp.module] = dict()
+                names[imp.alias] = imp.name if imp.alias == imp.name else f"{imp.name} as {imp.alias}"
+
+        lines = list[str]()
+        if imports:
+            lines.append(f"import {', '.join(imports)}")
+
+        lines.extend(f"from {module} import *" for module in import_stars)
+        lines.extend(f"from {module} import {', '.join(names.values())}" for (module, names) in import_froms.items())
+
+        return "\n".join(lines)
+
     def to_asts(self) -> list[ast.Import|ast.ImportFrom]:
-        imports = set[(str, str)]()
+        imports = dict[tuple[str, str], None]()
         import_stars = dict[str, ImportStarFromModule]()
-        import_froms = dict[str, (set[str], list[ast.alias])]()
+        import_froms = dict[str, dict[str, ast.alias]]()
         
-        for imp in self.ordered_imports:
-            match imp:
-                case ImportModule(module, alias):
-                    imports.add((module, alias))
-                case ImportStarFromModule(module):
-                    import_stars[module] = imp
-                case ImportFromModule(module, name, alias):
-                    import_from = import_froms.get(module)
-                    if import_from is None:
-                        import_from = (set[str](), list[ast.alias]())
-                        import_froms[module] = import_from
-                    
-                    s, l = import_from
-                    if alias not in s:
-                        s.add(alias)
-                        l.append(ast.alias(name, alias if alias != name else None))
+        for imp in self._bound_imports():
+            _BUCKET_HANDLERS[type(imp)](imp, imports, import_stars, import_froms)
         
         import_asts = list[ast.Import|ast.ImportFrom]()
 
-        if len(imports) > 0:
+        if imports:
             import_asts.append(ast.Import([ast.alias(module, alias if alias != module else None) for (module, alias) in imports]))
         
         import_asts.extend(imp.to_ast() for imp in import_stars.values())
 
-        for (module, (_, alias_list)) in import_froms.items():
+        for (module, aliases) in import_froms.items():
             level, module = split_module_name(module)
-            import_asts.append(ast.ImportFrom(module, alias_list, level))
+            import_asts.append(ast.ImportFrom(module, list(aliases.values()), level))
+
+        return import_asts
+
+def _bucket_import(imp: ImportModule, imports: dict[tuple[str, str], None], import_stars: dict[str, ImportStarFromModule], import_froms: dict[str, dict[str, ast.alias]]):
+    imports[(imp.module, imp.alias)] = None
+
+def _bucket_star(imp: ImportStarFromModule, imports: dict[tuple[str, str], None], import_stars: dict[str, ImportStarFromModule], import_froms: dict[str, dict[str, ast.alias]]):
+    import_stars[imp.module] = imp
+
+def _bucket_from(imp: ImportFromModule, imports: dict[tuple[str, str], None], import_stars: dict[str, ImportStarFromModule], import_froms: dict[str, dict[str, ast.alias]]):
+    aliases = import_froms.get(imp.module)
+    if aliases is None:
+        aliases = import_froms[imp.module] = dict()
+    
+    alias = imp.alias
+    aliases[alias] = ast.alias(imp.name, alias if alias != imp.name else None)
+
 
-        return import_asts
\ No newline at end of file
+_BUCKET_HANDLERS = {
+    ImportModule: _bucket_import,
+    ImportStarFromModule: _bucket_star,
+    ImportFromModule: _bucket_from,
+}
+""" type(imp) |-> function grouping `imp` into buckets (imports, import_stars, import_froms) in `ImportGroup.to_asts`. """
\ No newline at end of file
@@ -1,6 +1,8 @@
+import functools
+import os
+import stat
 import sys
-from pathlib import Path
-from importlib.machinery import PathFinder, ModuleSpec
+from importlib.machinery import PathFinder, ModuleSpec, EXTENSION_SUFFIXES, SOURCE_SUFFIXES, BYTECODE_SUFFIXES
 from importlib.util import spec_from_file_location
 
 def is_builtin_dir(path_dir:str) -> bool:
@@ -8,63 +10,205 @@ def is_builtin_dir(path_dir:str) -> bool:
 
 sys_path = [p for p in sys.path if p and not is_builtin_dir(p)]
 
+# Same order as the loaders of `FileFinder`.
+_MODULE_SUFFIXES = (*EXTENSION_SUFFIXES, *SOURCE_SUFFIXES, *BYTECODE_SUFFIXES)
+
+@functools.cache
 def split_module_name(module:str) -> tuple[int, str]:
-    for level in range(len(module)):
-        if module[level] != '.':
-            return (level, module[level:])
-    return (len(module), '')
+    stripped = module.lstrip('.')
+    return (len(module) - len(stripped), stripped)
 
 def find_spec_from(module:str, from_spec: ModuleSpec, from_locs: list[str]|None = None) -> ModuleSpec|None:
     """
         Find the spec for the module, assuming that a Python code in `file_path` is trying to import it, and its package path is `package_path`.
     """
-    level, module = split_module_name(module)
-
-    # Handle absolute import
-    if from_locs is None:
-        from_locs = from_spec.submodule_search_locations
-        if from_locs is not None:
-            from_locs = from_locs + sys_path
-    if not level:
+    # Nothing is cached between calls; use an `ImportResolver` to share results.
+    return ImportResolver().find_spec_from(module, from_spec, from_locs)
+
+class ImportResolver():
+    """
+        Resolves imports like `find_spec_from`, caching module resolutions, directory listings, and stat results.
+        Cached results assume that files are unchanged, so a resolver should only be used while that holds (e.g. during one pack).
+    """
+
+    __slots__ = ('_absolute_specs', '_relative_specs', '_path_specs', '_dir_finds', '_dir_listings', '_stats')
+
+    _absolute_specs: dict[tuple[str, tuple[str, ...]|None], ModuleSpec|None]
+    """ (module, from_locs) |-> spec """
+
+    _relative_specs: dict[tuple[str, int, str], ModuleSpec|None]
+    """ (module, level, origin) |-> spec """
+
+    _path_specs: dict[tuple[str, tuple[str, ...]|None], ModuleSpec|None]
+    """ (module, path) |-> spec """
+
+    _dir_finds: dict[tuple[str, str], tuple[bool, str|None]]
+    """ (path_dir, name) |-> result of `_find_in_dir` """
+
+    _dir_listings: dict[str, tuple[frozenset[str], frozenset[str]]]
+    """ path_dir |-> (names of files, names of directories) """
+
+    _stats: dict[str, os.stat_result|None]
+    """ path |-> stat result, or `None` when it can't be stat-ed """
+
+    def __init__(self):
+        self._absolute_specs = dict()
+        self._relative_specs = dict()
+        self._path_specs = dict()
+        self._dir_finds = dict()
+        self._dir_listings = dict()
+        self._stats = dict()
+
+    def find_spec_from(self, module:str, from_spec: ModuleSpec, from_locs: list[str]|None = None) -> ModuleSpec|None:
+        level, module = split_module_name(module)
+        if level:
+            return self._find_relative_spec(module, level, from_spec.origin)
+
+        if from_locs is None:
+            search_locs = from_spec.submodule_search_locations
+            if search_locs is not None:
+                from_locs = [*search_locs, *sys_path]
+
+        # Absolute imports don't depend on the importing file itself, so codes with the same search path share results.
+        return self._find_absolute_spec(module, None if from_locs is None else tuple(from_locs))
+
+    def _find_path_spec(self, module:str, path: tuple[str, ...]|None) -> ModuleSpec|None:
+        """
+            Cached `PathFinder.find_spec`; many modules share the same root package.
+            Directories in `path` are scanned with cached listings, and `PathFinder` is only used for anything else (zip files, extension modules, namespace packages, ...).
+        """
+        key = (module, path)
+        path_specs = self._path_specs
+        if key in path_specs:
+            return path_specs[key]
+
+        spec = path_specs[key] = self._find_path_spec_uncached(module, path)
+        return spec
+
+    def _find_path_spec_uncached(self, module:str, path: tuple[str, ...]|None) -> ModuleSpec|None:
+        tail = module.rpartition('.')[2]
+        for path_dir in (sys.path if path is None else path):
+            if not (isinstance(path_dir, str) and os.path.isabs(path_dir)): break
+            if (st := self._stat(path_dir)) is None: continue
+            if not stat.S_ISDIR(st.st_mode): break
+
+            found, origin = self._find_in_dir(path_dir, tail)
+            if not found: continue
+            if origin is None: break
+            return spec_from_file_location(module, origin)
+        else:
+            return None
+
+        return PathFinder.find_spec(module, None if path is None else list(path))
+
+    def _find_in_dir(self, path_dir:str, name:str) -> tuple[bool, str|None]:
+        """ Returns (whether `path_dir` provides `name`, path of its source file when it's a plain module or package). """
+        key = (path_dir, name)
+        if (found := self._dir_finds.get(key)) is not None:
+            return found
+
+        found = self._dir_finds[key] = self._find_in_dir_uncached(path_dir, name)
+        return found
+
+    def _find_in_dir_uncached(self, path_dir:str, name:str) -> tuple[bool, str|None]:
+        files, dirs = self._list_dir(path_dir)
+        if name in dirs:
+            package_files = self._list_dir(os.path.join(path_dir, name))[0]
+            for suffix in _MODULE_SUFFIXES:
+                if (file_name := f"__init__{suffix}") in package_files:
+                    return (True, os.path.join(path_dir, name, file_name) if suffix in SOURCE_SUFFIXES else None)
+        for suffix in _MODULE_SUFFIXES:
+            if (file_name := f"{name}{suffix}") in files:
+                return (True, os.path.join(path_dir, file_name) if suffix in SOURCE_SUFFIXES else None)
+        # A directory without `__init__` may be a portion of a namespace package.
+        return (name in dirs, None)
+
+    def _stat(self, path:str) -> os.stat_result|None:
+        stats = self._stats
+        if path in stats:
+            return stats[path]
+
+        try: st = os.stat(path)
+        except OSError: st = None
+
+        stats[path] = st
+        return st
+
+    def _is_dir(self, path:str) -> bool:
+        return (st := self._stat(path)) is not None and stat.S_ISDIR(st.st_mode)
+
+    def _list_dir(self, path_dir:str) -> tuple[frozenset[str], frozenset[str]]:
+        """ Returns (names of files, names of directories) in `path_dir`. """
+        if (listing := self._dir_listings.get(path_dir)) is not None:
+            return listing
+
+        files, dirs = set[str](), set[str]()
+        try:
+            with os.scandir(path_dir) as it:
+                for entry in it:
+                    if entry.is_file(): files.add(entry.name)
+                    elif entry.is_dir(): dirs.add(entry.name)
+        except OSError:
+            pass
+
+        listing = self._dir_listings[path_dir] = (frozenset(files), frozenset(dirs))
+        return listing
+
+    def _find_absolute_spec(self, module:str, from_locs: tuple[str, ...]|None) -> ModuleSpec|None:
+        key = (module, from_locs)
+        absolute_specs = self._absolute_specs
+        if key in absolute_specs:
+            return absolute_specs[key]
+
+        spec = absolute_specs[key] = self._find_absolute_spec_uncached(module, from_locs)
+        return spec
+
+    def _find_absolute_spec_uncached(self, module:str, from_locs: tuple[str, ...]|None) -> ModuleSpec|None:
         # Try finding the whole spec
-        if spec := PathFinder.find_spec(module, from_locs):
+        if spec := self._find_path_spec(module, from_locs):
             return spec
         
         # First, try locating the root module...
         root, _, rest = module.partition('.')
         if not rest: return None
 
-        spec = PathFinder.find_spec(root, from_locs)
-        if (spec is None) or (not rest): return spec
+        spec = self._find_path_spec(root, from_locs)
+        if spec is None: return None
         
         # ... then assume that we're resolving a relative import.
         # (This is not the correct way to find submodule, but let's ignore more complex cases.)
-        module = "." + rest
-        from_spec = spec
-        level = 1
-
-    # Relative import
-    rel_dir = Path(from_spec.origin)
-    for _ in range(level):
-        rel_dir = rel_dir.parent
-    assert rel_dir.is_dir()
-    if module:
-        segments = module.split('.')
-        for i, segment in enumerate(segments):
-            if i < len(segments) - 1:
-                rel_dir = rel_dir / segment
-            else:
-                module_path = rel_dir / f"{segment}.py"
-                if module_path.is_file():
-                    return spec_from_file_location(module, module_path)
-                module_path = rel_dir / segment
-                if module_path.is_dir():
-                    module_path = module_path / "__init__.py"
-                    if module_path.is_file():
-                        return spec_from_file_location(module, module_path)
-    else:
-        init_file_path = rel_dir / "__init__.py"
-        if init_file_path.is_file():
-            return spec_from_file_location(module, init_file_path)
-    
-    return None
\ No newline at end of file
+        return self._find_relative_spec(rest, 1, spec.origin)
+
+    def _find_relative_spec(self, module:str, level:int, origin:str) -> ModuleSpec|None:
+        key = (module, level, origin)
+        relative_specs = self._relative_specs
+        if key in relative_specs:
+            return relative_specs[key]
+
+        spec = relative_specs[key] = self._find_relative_spec_uncached(module, level, origin)
+        return spec
+
+    def _find_relative_spec_uncached(self, module:str, level:int, origin:str) -> ModuleSpec|None:
+        # Origins are absolute (`spec_from_file_location` makes them so), hence `dirname` walks up like `Path.parent`.
+        rel_dir = origin
+        for _ in range(level):
+            rel_dir = os.path.dirname(rel_dir)
+        assert self._is_dir(rel_dir)
+        if module:
+            segments = module.split('.')
+            for segment in segments[:-1]:
+                rel_dir = os.path.join(rel_dir, segment)
+            segment = segments[-1]
+
+            files, dirs = self._list_dir(rel_dir)
+            if (file_name := f"{segment}.py") in files:
+                return spec_from_file_location(module, os.path.join(rel_dir, file_name))
+            if segment in dirs:
+                module_dir = os.path.join(rel_dir, segment)
+                if "__init__.py" in self._list_dir(module_dir)[0]:
+                    return spec_from_file_location(module, os.path.join(module_dir, "__init__.py"))
+        else:
+            if "__init__.py" in self._list_dir(rel_dir)[0]:
+                return spec_from_file_location(module, os.path.join(rel_dir, "__init__.py"))
+        
+        return None
\ No newline at end of file
@@ -1,13 +1,25 @@
 import ast
-from contextlib import contextmanager
+import functools
+import gc
+import hashlib
+import os
+import pickle
+import sys
+from collections.abc import Callable, Iterator
 from pathlib import Path
 from importlib.machinery import ModuleSpec
 from importlib.util import spec_from_file_location
 
-from .import_group import ImportGroup
+from .ast_util import BLOCK_FIELDS
+from .import_group import ImportGroup, ImportStarFromModule, ImportFromModule
+
+AST_CACHE_ENV = 'IMPACKER_AST_CACHE'
+""" When this environment variable is set to `1`, parsed ASTs are pickled to `ast_cache_dir()` and reused while their files are unchanged. """
 
 class SourceCode():
-    """ Represents a source code file, with its (immediate) dependencies loaded. """
+    """ Represents a source code file, with its (immediate) dependencies loaded on first use. """
+
+    __slots__ = ('spec', 'name', 'root_ast', 'global_defines', 'global_define_names', 'global_define_index', 'imports', 'import_by_alias', 'star_imports', 'unresolved_globals', 'dependency', 'unparse_cache', '_ast_unpickled', '_is_read', '_transitive_deps', '_requires', '_externals', '_import_cache')
 
     spec: ModuleSpec
     name: str
@@ -17,8 +29,20 @@ class SourceCode():
     global_defines: dict[str, ast.FunctionDef|ast.AsyncFunctionDef|ast.ClassDef]
     """ id |-> AST defining it. """
 
+    global_define_names: frozenset[str]|None
+    """ Keys of `global_defines`, for fast set operations. Set once the source code is read. """
+
+    global_define_index: dict[str, int]
+    """ id |-> order of its (last) definition in the source code; redefinitions are ordered after everything defined before them. """
+
     imports: ImportGroup
 
+    import_by_alias: dict[str, list[tuple[int, ImportFromModule]]]
+    """ alias |-> list of (index in `imports`, `from ... import` defining it), last import first. """
+
+    star_imports: list[tuple[int, ImportStarFromModule]]
+    """ List of (index in `imports`, `from ... import *`), last import first. """
+
     unresolved_globals: set[str]
     """ The set of variables that must be imported from an external package. """
 
@@ -28,160 +52,539 @@ class SourceCode():
         If an unresolved global occurs outside of a definition, then the key will be an empty string.
     """
 
-    def __init__(self, spec: ModuleSpec, encoding:str='utf-8'):
+    unparse_cache: dict[int, str]
+    """ id(stmt) |-> ast.unparse(stmt), for statements in `root_ast` that have been unparsed. """
+
+    _ast_unpickled: bool
+    """ Whether `root_ast` is from the AST cache; its names are not interned then. """
+
+    _is_read: bool
+    """ Whether `read` has been called; attributes in `_READ_SLOTS` are unset until then. """
+
+    _transitive_deps: dict[str, frozenset[str]]|None
+
+    _requires: set[str]|None
+    """ Set of definitions that should be included (because they are referenced by main code). Managed by `Impacker`. """
+
+    _externals: set[str]|None
+    """ Set of variables that should be imported for this code. Managed by `Impacker`. """
+
+    _import_cache: dict[str, 'SourceCode|None']|None
+    """ module |-> source code imported by this code. Managed by `Impacker`. """
+
+    def __init__(self, spec: ModuleSpec, encoding:str|None=None):
+        """ When `encoding` is not given, it is detected like Python does (UTF-8 unless declared otherwise). """
         self.spec = spec
         if not self.spec.submodule_search_locations:
             self.spec.submodule_search_locations = [str(Path(self.spec.origin).parent)]
 
         self.name = Path(self.spec.origin).name
 
+        self.unparse_cache = dict()
+        self._transitive_deps = None
+
+        # Set by `Impacker` when it starts using this code.
+        self._requires = None
+        self._externals = None
+        self._import_cache = None
+
+        self.root_ast, self._ast_unpickled = read_ast(self.spec.origin, encoding)
+        self._is_read = False
+
+    def __getattr__(self, attr: str):
+        # Only called for unset slots; tables from `read` are filled on their first use.
+        if attr in _READ_SLOTS and not self._is_read:
+            self.read()
+            return getattr(self, attr)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {attr!r}")
+
+    def read(self) -> 'SourceCode':
+        """ Reads definitions, imports, and dependencies from `root_ast`. This happens on first use of any of them, unless called explicitly. """
+        if self._is_read: return self
+        self._is_read = True
+
         self.global_defines = dict()
+        self.global_define_names = None
+        self.global_define_index = dict()
         self.imports = ImportGroup()
         self.unresolved_globals = set()
         self.dependency = dict()
 
-        with open(self.spec.origin, 'r', encoding=encoding) as f:
-            src = f.read()
-            self.root_ast = ast.parse(src, self.spec.origin, type_comments=True)
-        
         reader = SourceCodeReader(self)
         reader.visit(self.root_ast)
+        if self._ast_unpickled: self._intern_names()
+        self.global_define_names = frozenset(self.global_defines)
+
+        import_by_alias = dict()
+        star_imports = list()
+        for i, imp in reversed(list(enumerate(self.imports.ordered_imports))):
+            imp_type = type(imp)
+            if imp_type is ImportFromModule:
+                import_by_alias.setdefault(imp.alias, []).append((i, imp))
+            elif imp_type is ImportStarFromModule:
+                star_imports.append((i, imp))
+
+        self.import_by_alias = import_by_alias
+        self.star_imports = star_imports
+        return self
+
+    def read_imports(self) -> 'SourceCode':
+        """
+            Reads only `imports`, which is all that's needed to pack the whole code (without tree shaking).
+            Only statements are visited, in the same order as `read` does; other tables are still read on their first use.
+        """
+        if self._is_read or _is_set(self, 'imports'): return self
+
+        imports = ImportGroup()
+        stack: list[ast.AST] = self.root_ast.body[::-1]
+        while stack:
+            node = stack.pop()
+            node_type = type(node)
+            if node_type is ast.Import or node_type is ast.ImportFrom:
+                imports.add(node)
+                continue
+
+            if (fields := _NODE_BLOCK_FIELDS.get(node_type)) is None:
+                fields = _NODE_BLOCK_FIELDS[node_type] = tuple(field for field in reversed(node_type._fields) if field in BLOCK_FIELDS)
+            for field in fields:
+                stack.extend(reversed(getattr(node, field)))
+
+        self.imports = imports
+        return self
+
+    def __getstate__(self):
+        # Tables that are not read yet are left unset, instead of being read (via `__getattr__`) to be pickled.
+        state = dict()
+        for attr in self.__slots__:
+            if _is_set(self, attr): state[attr] = getattr(self, attr)
+        return (None, state)
+
+    def _intern_names(self):
+        """ Unlike ones from the parser, identifiers of unpickled ASTs are not interned; names shared with other codes are interned here. """
+        intern = sys.intern
+        self.global_defines = {intern(name): def_ast for (name, def_ast) in self.global_defines.items()}
+        self.global_define_index = {intern(name): i for (name, i) in self.global_define_index.items()}
+        self.unresolved_globals = {intern(name) for name in self.unresolved_globals}
+        self.dependency = {intern(name): {intern(dep) for dep in deps} for (name, deps) in self.dependency.items()}
 
     def __str__(self): return f"<SourceCode {repr(self.spec.origin)}>"
     def __repr__(self): return f"SourceCode({repr(self.spec)})"
 
+    @property
+    def transitive_deps(self) -> dict[str, frozenset[str]]:
+        """
+            id |-> set of all variables needed by the definition (including itself), directly or indirectly.
+            Only definitions in `global_defines` are followed; other variables are included as-is.
+        """
+        if self._transitive_deps is None:
+            self._transitive_deps = transitive_closure(self.global_define_names, self.dependency)
+        return self._transitive_deps
+
     def add_global_define(self, def_ast: ast.FunctionDef|ast.AsyncFunctionDef|ast.ClassDef):
+        assert self.global_define_names is None, "definitions can't be added once the source code is read"
         self.global_defines[def_ast.name] = def_ast
+        # Definitions are added in source code order, and a redefinition replaces the previous one at its own position.
+        # Indices increase along the (insertion) order of the dict, so the next index follows the last one.
+        index = self.global_define_index
+        index.pop(def_ast.name, None)
+        index[def_ast.name] = next(reversed(index.values()), -1) + 1
     
     def add_import(self, ast: ast.Import|ast.ImportFrom):
         self.imports.add(ast)
     
     @staticmethod
     def from_path(src_path: Path|str):
-        if not isinstance(src_path, Path):
-            src_path = Path(src_path)
-        spec = spec_from_file_location(src_path.stem, src_path)
-        return SourceCode(spec) if spec else None
+        """ Source codes are shared while their files are unchanged, so they must not be modified (the ASTs included); `Impacker` packs copies of them. """
+        src_path = Path(src_path).absolute()
+        try:
+            st = src_path.stat()
+        except OSError:
+            # Let reading the file report the error.
+            return _read_source_code(src_path)
+        return _read_source_code_cached(src_path, st.st_mtime_ns, st.st_size)
+
+@functools.lru_cache(maxsize=128)
+def _read_source_code_cached(src_path: Path, mtime_ns: int, size: int) -> SourceCode|None:
+    return _read_source_code(src_path)
+
+def _read_source_code(src_path: Path) -> SourceCode|None:
+    spec = spec_from_file_location(src_path.stem, src_path)
+    return SourceCode(spec) if spec else None
+
+RECENT_AST_COUNT = 256
+""" Number of recently read ASTs kept in memory, to be shared by source codes of unchanged files. """
+
+_recent_asts = dict[tuple[str, int, int, str|None], tuple[ast.Module, bool]]()
+""" (origin, mtime_ns, size, encoding) |-> (AST, whether it was unpickled), oldest first. """
+
+_READ_SLOTS = frozenset(('global_defines', 'global_define_names', 'global_define_index', 'imports', 'import_by_alias', 'star_imports', 'unresolved_globals', 'dependency'))
+""" Attributes of `SourceCode` set by `SourceCode.read`. """
+
+_NODE_BLOCK_FIELDS = dict[type, tuple[str, ...]]()
+""" type(node) |-> `BLOCK_FIELDS` of `node`, in reverse order. """
+
+def _is_set(code: SourceCode, attr: str) -> bool:
+    """ Whether the slot `attr` of `code` is set; unlike `hasattr`, tables are not read for this. """
+    try: object.__getattribute__(code, attr)
+    except AttributeError: return False
+    return True
 
-class SourceCodeReader(ast.NodeVisitor):
+def read_ast(origin: str, encoding: str|None = None) -> tuple[ast.Module, bool]:
+    """
+        Returns (AST of the file at `origin`, whether it was unpickled from the AST cache).
+        ASTs are shared while the file is unchanged, so they must not be modified.
+    """
+    # The whole file is read at once, so there's no need for a buffered reader.
+    with open(origin, 'rb', buffering=0) as f:
+        st = os.fstat(f.fileno())
+        key = (origin, st.st_mtime_ns, st.st_size, encoding)
+        if (entry := _recent_asts.get(key)) is not None:
+            return entry
+
+        cache_path = ast_cache_path(origin, st, encoding)
+        root_ast = None if cache_path is None else load_cached_ast(cache_path)
+        is_unpickled = root_ast is not None
+        if not is_unpickled:
+            src = f.read()
+
+    if not is_unpickled:
+        if encoding is not None:
+            src = src.decode(encoding)
+
+        # Same as `ast.parse(src, origin, type_comments=True)`; type comments are kept, as `ast.unparse` writes them back.
+        root_ast = compile(src, origin, 'exec', ast.PyCF_ONLY_AST | ast.PyCF_TYPE_COMMENTS, dont_inherit=True)
+        if cache_path is not None:
+            dump_cached_ast(cache_path, root_ast)
+
+    if len(_recent_asts) >= RECENT_AST_COUNT:
+        del _recent_asts[next(iter(_recent_asts))]
+    entry = _recent_asts[key] = (root_ast, is_unpickled)
+    return entry
+
+def ast_cache_dir() -> str:
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'impacker')
+
+def ast_cache_path(origin: str, st: os.stat_result, encoding: str|None) -> str|None:
+    """ Returns where the AST of `origin` (with stat result `st`) would be cached, or `None` when the cache is disabled. """
+    if os.environ.get(AST_CACHE_ENV) != '1': return None
+    key = f"{origin}|{st.st_mtime_ns}|{st.st_size}|{encoding}|{sys.version}"
+    return os.path.join(ast_cache_dir(), hashlib.blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=16).hexdigest() + ".pkl")
+
+def load_cached_ast(cache_path: str) -> ast.Module|None:
+    # Unpickling creates every node at once, which would otherwise trigger many (useless) collections.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(cache_path, 'rb') as f:
+            root_ast = pickle.load(f)
+    except Exception:
+        # A missing or corrupted cache entry is simply ignored (and overwritten).
+        return None
+    finally:
+        if gc_enabled: gc.enable()
+    return root_ast if isinstance(root_ast, ast.Module) else None
+
+def dump_cached_ast(cache_path: str, root_ast: ast.Module):
+    """ Writes `root_ast` to `cache_path` atomically; failing to write the cache is not an error. """
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(root_ast, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        # Pickling may also fail, e.g. with `RecursionError` on deeply nested expressions.
+        try: os.remove(tmp_path)
+        except OSError: pass
+
+def transitive_closure(nodes, edges: dict[str, set[str]]) -> dict[str, frozenset[str]]:
+    """
+        Computes, for each of `nodes`, the set of everything reachable from it via `edges` (including itself).
+        Targets not in `nodes` are included but not followed. Uses an iterative version of Tarjan's SCC algorithm.
+    """
+    closures = dict[str, frozenset[str]]()
+    index = dict[str, int]()
+    lowlink = dict[str, int]()
+    scc_stack = list[str]()
+    on_stack = set[str]()
+    work = list[tuple[str, Iterator[str]]]()
+
+    def enter(v: str):
+        index[v] = lowlink[v] = len(index)
+        scc_stack.append(v)
+        on_stack.add(v)
+        work.append((v, iter(edges.get(v, ()))))
+
+    for root in nodes:
+        if root in index: continue
+        enter(root)
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if w not in nodes: continue
+                if w not in index:
+                    enter(w)
+                    break
+                if w in on_stack:
+                    lowlink[v] = min(lowlink[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    lowlink[u] = min(lowlink[u], lowlink[v])
+                if lowlink[v] != index[v]: continue
+
+                # `v` is the root of an SCC; every SCC reachable from it has already been closed.
+                scc = list[str]()
+                while True:
+                    w = scc_stack.pop()
+                    on_stack.discard(w)
+                    scc.append(w)
+                    if w == v: break
+
+                closure = set(scc)
+                for w in scc:
+                    if not (deps := edges.get(w)): continue
+                    closure |= deps
+                    # Nodes in `deps` are either in `scc` or in an already closed SCC.
+                    for x in (deps & nodes).difference(scc):
+                        closure |= closures[x]
+
+                closure = frozenset(closure)
+                for w in scc: closures[w] = closure
+
+    return closures
+
+class _ScopeEnd():
+    """ Marker pushed below the children of a scope, so that the scope is left after all of them are read. """
+    __slots__ = tuple()
+
+_SCOPE_END = _ScopeEnd()
+
+SET_POOL_SIZE = 64
+""" Maximum number of sets kept by `SourceCodeReader` for reuse. """
+
+_NO_NAMES = frozenset[str]()
+""" Names defined by a scope, until it defines any; saves allocating sets for scopes that define nothing. """
+
+# Saves attribute lookups on `ast` for every name read.
+_LOAD, _STORE = ast.Load, ast.Store
+
+class SourceCodeReader():
     """
         Initializes a `SourceCode` object. In specific:
         - Finds all import statements from the code.
         - Finds which undefined global variables are being referenced.
 
+        Nodes are read with an explicit stack (no recursion), in the same order as `ast.NodeVisitor` would visit them.
+
         Note: variables introduced by match-cases are currently not correctly handled.
     """
 
-    __slots__ = ('src', 'defined_stack')
+    __slots__ = ('src', 'defined_stack', 'module_scope', 'curr_scope', 'defined_counts', 'curr_top_def_name', 'curr_dependency', 'add_unresolved', 'set_pool')
     src: SourceCode
-    defined_stack: list[set[str]]
+    defined_stack: list[set[str]|frozenset[str]]
+    """ Names defined by each scope; scopes that haven't defined anything share `_NO_NAMES`. """
+
+    module_scope: set[str]
+    """ `defined_stack[0]` """
+
+    curr_scope: set[str]|frozenset[str]
+    """ `defined_stack[-1]` """
+
+    defined_counts: dict[str, int]
+    """ name |-> number of scopes in `defined_stack[1:]` defining it. """
+
     curr_top_def_name: str
 
+    curr_dependency: set[str]|None
+    """ `src.dependency[curr_top_def_name]`, once it exists. """
+
+    add_unresolved: Callable[[str], None]
+    """ `src.unresolved_globals.add` """
+
+    set_pool: list[set[str]]
+    """ Empty sets from scopes that have been left, to be reused by new scopes. """
+
     def __init__(self, src: SourceCode):
-        super().__init__()
         self.src = src
-        self.defined_stack = [set()]
+        self.module_scope = self.curr_scope = set()
+        self.defined_stack = [self.module_scope]
+        self.defined_counts = dict()
         self.curr_top_def_name = ""
+        self.curr_dependency = None
+        self.add_unresolved = src.unresolved_globals.add
+        self.set_pool = list()
     
     def is_defined(self, var_name: str) -> bool:
-        for defs in reversed(self.defined_stack):
-            if var_name in defs: return True
-        return False
+        return var_name in self.defined_counts or var_name in self.module_scope
+
+    def define(self, name: str):
+        defs = self.curr_scope
+        if name in defs: return
+
+        if defs is _NO_NAMES:
+            defs = self.curr_scope = self.defined_stack[-1] = self.new_scope_set()
+        defs.add(name)
+        if defs is not self.module_scope:
+            self.defined_counts[name] = self.defined_counts.get(name, 0) + 1
     
+    def new_scope_set(self) -> set[str]:
+        return self.set_pool.pop() if self.set_pool else set()
+
     def add_define(self, def_ast: ast.FunctionDef|ast.AsyncFunctionDef|ast.ClassDef):
-        self.defined_stack[-1].add(def_ast.name)
+        self.define(def_ast.name)
         if len(self.defined_stack) == 1:
             self.src.add_global_define(def_ast)
     
     def add_args(self, args_ast: ast.arguments):
-        defs = self.defined_stack[-1]
-        defs.update(arg.arg for arg in args_ast.posonlyargs)
-        defs.update(arg.arg for arg in args_ast.args)
-        defs.update(arg.arg for arg in args_ast.kwonlyargs)
-
+        """ Defines arguments in the innermost scope, which must be a new (empty) function scope. """
+        names = [arg.arg for arg in (*args_ast.posonlyargs, *args_ast.args, *args_ast.kwonlyargs)]
         if args_ast.vararg:
-            defs.add(args_ast.vararg.arg)
-
+            names.append(args_ast.vararg.arg)
         if args_ast.kwarg:
-            defs.add(args_ast.kwarg.arg)
+            names.append(args_ast.kwarg.arg)
+
+        if not names: return
+
+        # Argument names are distinct, so each is counted once.
+        defs = self.curr_scope = self.defined_stack[-1] = self.new_scope_set()
+        defs.update(names)
+        defined_counts = self.defined_counts
+        for name in names:
+            defined_counts[name] = defined_counts.get(name, 0) + 1
     
     def add_name_read(self, name:str):
         # Recursion
         if name == self.curr_top_def_name: return
 
-        for i in reversed(range(len(self.defined_stack))):
-            if not i:
-                # `self.curr_top_def_name` either needs an unresolved global, or another top-level definition.
-                dep = self.src.dependency.get(self.curr_top_def_name)
-                if dep is None:
-                    dep = set()
-                    self.src.dependency[self.curr_top_def_name] = dep
-                dep.add(name)
-            if name in self.defined_stack[i]:
-                return
+        # Defined in a local scope.
+        if name in self.defined_counts: return
+
+        # `self.curr_top_def_name` either needs an unresolved global, or another top-level definition.
+        dep = self.curr_dependency
+        if dep is None:
+            dep = self.curr_dependency = self.src.dependency.setdefault(self.curr_top_def_name, set())
+        dep.add(name)
+
+        if name in self.module_scope: return
         
-        self.src.unresolved_globals.add(name)
-    
-    @contextmanager
-    def handle_visit_scope(self, node: ast.FunctionDef|ast.AsyncFunctionDef|ast.ClassDef|ast.Lambda):
-        match node:
-            case ast.Lambda(): pass
-            case _:
-                self.add_define(node)
+        self.add_unresolved(name)
+
+    def visit(self, root: ast.AST):
+        get_handler = self._HANDLERS.get
+        get_fields = _CHILD_FIELDS.get
+        stack: list[ast.AST|_ScopeEnd] = [root]
+        pop, push = stack.pop, stack.append
+        while stack:
+            node = pop()
+            node_type = type(node)
+            if handler := get_handler(node_type):
+                handler(self, node, stack)
+                continue
+
+            # Same as `push_children(node, stack)`, inlined as most nodes take this path.
+            if (fields := get_fields(node_type)) is None:
+                fields = child_fields(node_type)
+            for field in fields:
+                value = getattr(node, field, None)
+                if isinstance(value, ast.AST):
+                    push(value)
+                elif type(value) is list:
+                    for item in reversed(value):
+                        if isinstance(item, ast.AST): push(item)
+
+    def visit_scope(self, node: ast.FunctionDef|ast.AsyncFunctionDef|ast.ClassDef|ast.Lambda, stack: list[ast.AST|_ScopeEnd]):
+        node_type = type(node)
+        if node_type is not ast.Lambda:
+            self.add_define(node)
         
-                if len(self.defined_stack) == 1:
-                    self.curr_top_def_name = node.name
+            if len(self.defined_stack) == 1:
+                self.curr_top_def_name = node.name
+                self.curr_dependency = None
 
-        self.defined_stack.append(set())
+        self.curr_scope = _NO_NAMES
+        self.defined_stack.append(_NO_NAMES)
 
-        match node:
-            case ast.ClassDef(): pass
-            case _: self.add_args(node.args)
+        if node_type is not ast.ClassDef:
+            self.add_args(node.args)
 
-        super().generic_visit(node)
+        stack.append(_SCOPE_END)
+        push_children(node, stack)
 
-        self.defined_stack.pop()
-        if len(self.defined_stack) == 1:
+    def visit_scope_end(self, _: _ScopeEnd, stack: list[ast.AST|_ScopeEnd]):
+        defined_counts = self.defined_counts
+        defined_stack = self.defined_stack
+        defs = defined_stack.pop()
+        if defs is not _NO_NAMES:
+            for name in defs:
+                if count := defined_counts[name] - 1:
+                    defined_counts[name] = count
+                else:
+                    del defined_counts[name]
+
+            if len(self.set_pool) < SET_POOL_SIZE:
+                defs.clear()
+                self.set_pool.append(defs)
+        self.curr_scope = defined_stack[-1]
+        if len(defined_stack) == 1:
             self.curr_top_def_name = ""
+            self.curr_dependency = None
 
-    def visit_Import(self, node: ast.Import):
+    def visit_Import(self, node: ast.Import, stack: list[ast.AST|_ScopeEnd]):
         self.src.add_import(node)
 
-    def visit_ImportFrom(self, node: ast.ImportFrom):
+    def visit_ImportFrom(self, node: ast.ImportFrom, stack: list[ast.AST|_ScopeEnd]):
         self.src.add_import(node)
 
-    def visit_FunctionDef(self, node: ast.FunctionDef):
-        self.handle_visit_scope(node)
+    def visit_Name(self, node: ast.Name, stack: list[ast.AST|_ScopeEnd]):
+        ctx_type = type(node.ctx)
+        if ctx_type is _LOAD:
+            self.add_name_read(node.id)
+        elif ctx_type is _STORE:
+            self.define(node.id)
 
-    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
-        self.handle_visit_scope(node)
-    
-    def visit_ClassDef(self, node: ast.ClassDef):
-        self.handle_visit_scope(node)
-    
-    def visit_Lambda(self, node: ast.Lambda):
-        self.handle_visit_scope(node)
-
-    def visit_Name(self, node: ast.Name):
-        match node.ctx:
-            case ast.Store():
-                self.defined_stack[-1].add(node.id)
-            case ast.Load():
-                self.add_name_read(node.id)
-
-    def visit_Attribute(self, node: ast.Attribute):
-        segments = []
-        go_deeper = True
-        while go_deeper:
-            segments.append(node.attr)
-            match node.value:
-                case ast.Name(val_id):
-                    segments.append(val_id)
-                    go_deeper = False
-                case ast.Attribute:
-                    node = node.value
-                case _:
-                    super().generic_visit(node.value)
-                    return
-        assert(len(segments) > 1)
-        self.add_name_read(segments[-1])
\ No newline at end of file
+    def visit_Attribute(self, node: ast.Attribute, stack: list[ast.AST|_ScopeEnd]):
+        # Only the leftmost name of `a.b.c` is a variable read.
+        value = node.value
+        while type(value) is ast.Attribute:
+            value = value.value
+
+        if type(value) is ast.Name:
+            self.add_name_read(value.id)
+        else:
+            push_children(value, stack)
+
+    _HANDLERS = {
+        _ScopeEnd: visit_scope_end,
+        ast.Import: visit_Import,
+        ast.ImportFrom: visit_ImportFrom,
+        ast.FunctionDef: visit_scope,
+        ast.AsyncFunctionDef: visit_scope,
+        ast.ClassDef: visit_scope,
+        ast.Lambda: visit_scope,
+        ast.Name: visit_Name,
+        ast.Attribute: visit_Attribute,
+    }
+    """ type(node) |-> handler; other nodes just have their children read. """
+
+_CHILD_FIELDS = dict[type, tuple[str, ...]]()
+""" type(node) |-> fields of `node` that may contain its children, in reverse order; expression contexts (`ast.Load`, ...) are skipped. """
+
+def child_fields(node_type: type) -> tuple[str, ...]:
+    fields = _CHILD_FIELDS[node_type] = tuple(field for field in reversed(node_type._fields) if field != 'ctx')
+    return fields
+
+def push_children(node: ast.AST, stack: list[ast.AST|_ScopeEnd]):
+    """ Pushes children of `node` so that they are popped in the order `ast.NodeVisitor.generic_visit` visits them. """
+    if (fields := _CHILD_FIELDS.get(type(node))) is None:
+        fields = child_fields(type(node))
+
+    # Same as `ast.iter_child_nodes`, but backwards and without its generators.
+    for field in fields:
+        value = getattr(node, field, None)
+        if isinstance(value, ast.AST):
+            stack.append(value)
+        elif type(value) is list:
+            for item in reversed(value):
+                if isinstance(item, ast.AST): stack.append(item)
\ No newline at end of file
@@ -1,5 +1,10 @@
 import unittest
 
+from .test_ast_cache import *
+from .test_jobs import *
+from .test_pack import *
+from .test_strip import *
+
 class TestExamples(unittest.TestCase):
     def test(self):
         pass
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from impacker.source_code import AST_CACHE_ENV
+
+from .util import pack_files, run_code
+
+class TestASTCache(unittest.TestCase):
+    def test_deep_ast(self):
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ, {AST_CACHE_ENV: '1', 'XDG_CACHE_HOME': cache_dir}):
+            code = pack_files({
+                'lib.py': f"""
+                    def f(): return 1
+                    def g(): return {'+'.join(['1'] * 450)}
+                """,
+                'main.py': """
+                    from .lib import f
+                    print(f())
+                """,
+            })
+            self.assertEqual(run_code(code), "1\n")
+            leftovers = [name for name in os.listdir(os.path.join(cache_dir, 'impacker')) if name.endswith('.tmp')]
+            self.assertEqual(leftovers, [])
@@ -0,0 +1,49 @@
+import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from .util import pack_files, run_code
+
+FILES = {
+    'main.py': """
+        from .a import f
+        from .pkg import g
+        print(f(), g())
+    """,
+    'a.py': """
+        from .b import h
+        from .c import *
+        def f(): return h() + i()
+    """,
+    'b.py': "def h(): return 1",
+    'c.py': "def i(): return 2",
+    'pkg/__init__.py': """
+        from .d import g
+    """,
+    'pkg/d.py': """
+        from ..b import h
+        def g(): return h() * 10
+    """,
+}
+
+class CountingProcessPoolExecutor(ProcessPoolExecutor):
+    instances = 0
+
+    def __init__(self, *args, **kwargs):
+        type(self).instances += 1
+        super().__init__(*args, **kwargs)
+
+class TestJobs(unittest.TestCase):
+    def test_jobs(self):
+        for kwargs in (dict(), dict(shake_tree=False)):
+            with self.subTest(**kwargs):
+                code = pack_files(FILES, **kwargs)
+                self.assertEqual(run_code(code), "3 10\n")
+                self.assertEqual(pack_files(FILES, jobs=4, **kwargs), code)
+
+                # Every level of the import graph is large enough to be parsed in processes.
+                instances = CountingProcessPoolExecutor.instances
+                with mock.patch('impacker.impacker.PROCESS_POOL_MIN_BYTES', 0), mock.patch('impacker.impacker.ProcessPoolExecutor', CountingProcessPoolExecutor):
+                    self.assertEqual(pack_files(FILES, jobs=4, **kwargs), code)
+                self.assertGreater(CountingProcessPoolExecutor.instances, instances)
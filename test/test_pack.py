@@ -0,0 +1,168 @@
+import tempfile
+import textwrap
+import unittest
+
+from importlib.util import spec_from_file_location
+from pathlib import Path
+
+from impacker import Impacker, SourceCode
+
+from .util import pack_files, run_code
+
+class TestPackOrder(unittest.TestCase):
+    def test_redefinition_order(self):
+        code = pack_files({
+            'lib.py': """
+                def Thing(): pass
+                class Base: pass
+                class Thing(Base): pass
+            """,
+            'main.py': """
+                from .lib import Thing
+                print(Thing.__mro__[1].__name__)
+            """,
+        })
+        self.assertEqual(run_code(code), "Base\n")
+
+    def test_conditional_redefinition_order(self):
+        code = pack_files({
+            'lib.py': """
+                import sys
+                if sys.version_info < (3,):
+                    def Thing(): pass
+                else:
+                    def Thing(): return Base()
+                class Base: pass
+                try:
+                    def Other(): pass
+                except Exception:
+                    pass
+                class Other(Base): pass
+            """,
+            'main.py': """
+                from .lib import Thing, Other
+                print(type(Thing()).__name__, Other.__mro__[1].__name__)
+            """,
+        })
+        self.assertEqual(run_code(code), "Base Base\n")
+
+    def test_last_import_wins(self):
+        code = pack_files({
+            'a.py': "def x(): return 'a'",
+            'b.py': "def x(): return 'b'",
+            'mid.py': """
+                from .a import x
+                from .b import x
+                from .a import x
+            """,
+            'main.py': """
+                from .mid import x
+                print(x())
+            """,
+        })
+        self.assertEqual(run_code(code), "a\n")
+
+    def test_last_external_import_wins(self):
+        code = pack_files({
+            'main.py': """
+                from shlex import quote
+                from os.path import join
+                from shlex import join
+                print(join(['a', 'b']), quote('c'))
+            """,
+        })
+        self.assertEqual(run_code(code), "a b c\n")
+
+    def test_type_comments(self):
+        code = pack_files({
+            'lib.py': """
+                def f(a):
+                    # type: (int) -> int
+                    return a
+            """,
+            'main.py': """
+                from .lib import f
+                print(f(1))
+            """,
+        })
+        self.assertIn("# type: (int) -> int", code)
+        self.assertEqual(run_code(code), "1\n")
+
+class TestPackRuns(unittest.TestCase):
+    def test_module_added_between_packs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            main_path = root / 'main.py'
+            main_path.write_text("from .lib import x\nprint(x())\n", encoding='utf-8')
+
+            impacker = Impacker()
+            self.assertIn("from .lib import x", impacker.pack(SourceCode.from_path(main_path)))
+
+            (root / 'lib.py').write_text("def x(): return 1\n", encoding='utf-8')
+            for packer in (impacker, Impacker()):
+                code = packer.pack(SourceCode.from_path(main_path))
+                self.assertNotIn("import", code)
+                self.assertEqual(run_code(code), "1\n")
+
+    def test_shared_source_code(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            (root / 'lib.py').write_text("def x(): return 1\ndef y(): return 2\n", encoding='utf-8')
+            (root / 'a.py').write_text("from .lib import x\nprint(x())\n", encoding='utf-8')
+
+            in_code = SourceCode.from_path(root / 'a.py')
+            self.assertIs(in_code, SourceCode.from_path(root / 'a.py'))
+
+            code = Impacker().pack(in_code)
+            self.assertIsNone(in_code._requires)
+            self.assertIsNone(in_code._import_cache)
+
+            self.assertEqual(Impacker().pack(in_code), code)
+            self.assertEqual(run_code(code), "1\n")
+
+class TestPackParts(unittest.TestCase):
+    FILES = {
+        'lib.py': """
+            import os
+            from .util import helper
+            def f(): return helper(os.sep)
+            class C:
+                def g(self): return f()
+        """,
+        'util.py': "def helper(x): return x",
+        'main.py': """
+            from .lib import C
+            from os.path import join
+            print(C().g() == join('', ''))
+        """,
+    }
+
+    def test_pack_parts(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            for (name, code) in self.FILES.items():
+                (root / name).write_text(textwrap.dedent(code), encoding='utf-8')
+
+            for kwargs in (dict(), dict(shake_tree=False), dict(strip=True)):
+                with self.subTest(**kwargs):
+                    in_code = SourceCode.from_path(root / 'main.py')
+                    parts = Impacker(**kwargs).pack_parts(in_code)
+                    self.assertTrue(all(type(part) is str for part in parts))
+                    self.assertEqual("".join(parts), Impacker(**kwargs).pack(in_code))
+
+    def test_read_imports(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'lib.py'
+            path.write_text(textwrap.dedent(self.FILES['lib.py']), encoding='utf-8')
+            spec = spec_from_file_location('lib', path)
+
+            eager = SourceCode(spec).read()
+            lazy = SourceCode(spec).read_imports()
+            self.assertEqual(list(lazy.imports), list(eager.imports))
+
+            # Other tables are read on their first use.
+            self.assertEqual(lazy.dependency, eager.dependency)
+            self.assertEqual(lazy.global_defines.keys(), eager.global_defines.keys())
+            self.assertEqual(lazy.global_define_index, eager.global_define_index)
+            self.assertEqual(lazy.unresolved_globals, eager.unresolved_globals)
+            self.assertEqual(list(lazy.imports), list(eager.imports))
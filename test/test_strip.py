@@ -0,0 +1,56 @@
+import argparse
+import ast
+import unittest
+
+from impacker import Impacker, SourceCode
+
+from .util import pack_files, run_code
+
+class TestStripDocstring(unittest.TestCase):
+    def test_strip(self):
+        code = pack_files({
+            'lib.py': '''
+                """ Module docstring. """
+                """ Another string at the module level. """
+
+                def f():
+                    """ Function docstring. """
+
+                def g():
+                    """ Function docstring. """
+                    ...
+
+                class C:
+                    """ Class docstring. """
+                    def h(self):
+                        """ Method docstring. """
+                        try:
+                            def i():
+                                """ Nested docstring. """
+                                return ...
+                        except Exception:
+                            def i():
+                                """ Nested docstring. """
+                        finally:
+                            pass
+                        return i()
+            ''',
+            'main.py': """
+                from .lib import f, g, C
+                print(f(), g(), C().h())
+            """,
+        }, strip_docstring=True)
+        self.assertNotIn("docstring", code)
+        self.assertNotIn("string at", code)
+        self.assertEqual(run_code(code), "None None Ellipsis\n")
+
+        lib_asts = {stmt.name: stmt for stmt in ast.parse(code).body if isinstance(stmt, (ast.FunctionDef, ast.ClassDef))}
+        self.assertIsInstance(lib_asts['f'].body[0], ast.Pass)
+        self.assertIsInstance(lib_asts['g'].body[0].value, ast.Constant)
+        self.assertIs(lib_asts['g'].body[0].value.value, ...)
+
+    def test_strip_main(self):
+        # Packing a large module with `-s` exercises every kind of statement body.
+        code = Impacker(strip=True).pack(SourceCode.from_path(argparse.__file__))
+        self.assertNotIn('"""', code)
+        compile(code, argparse.__file__, 'exec')
@@ -0,0 +1,25 @@
+import contextlib
+import io
+import tempfile
+import textwrap
+
+from pathlib import Path
+
+from impacker import Impacker, SourceCode
+
+def pack_files(files: dict[str, str], main: str = 'main.py', **kwargs) -> str:
+    """ Writes `files` into a temporary directory, then packs `main` with an `Impacker` created with `kwargs`. """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        for (name, code) in files.items():
+            path = root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(textwrap.dedent(code), encoding='utf-8')
+        return Impacker(**kwargs).pack(SourceCode.from_path(root / main))
+
+def run_code(code: str) -> str:
+    """ Executes packed code as a script, and returns what it printed. """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        exec(compile(code, "<packed>", 'exec'), {'__name__': '__main__'})
+    return out.getvalue()